@@ -1,87 +1,189 @@
+# Modules only needed on some code paths (json, datetime, hashlib, importlib.util) are imported where used
 import os
+import re
 import subprocess
-import json
 import sys
 import tempfile
-import yaml
 import shutil
 import logging
 import argparse
-from datetime import datetime
-from contextlib import contextmanager
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
 
 # Global variable for Kubernetes config
 kube_config = None
 
-# Context manager for changing directories safely
-@contextmanager
-def change_directory(path):
-    original_dir = os.getcwd()
+# Paths under the user's home directory, resolved once at load time
+HOME = os.path.expanduser('~')
+KUBE_CONFIG_DEFAULT = f'{HOME}/.kube/config'
+LOCAL_BIN = f'{HOME}/.local/bin'
+
+# Number of trailing output lines kept by run_command
+OUTPUT_TAIL_LINES = 2000
+
+# Default Terraform apply parallelism
+TF_PARALLELISM_DEFAULT = 30
+
+# Function to parse a positive integer (used for parallelism from the CLI and environment)
+def positive_int(value):
     try:
-        os.chdir(path)
-        yield
-    finally:
-        os.chdir(original_dir)
+        number = int(value)
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid positive integer: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"value must be at least 1, got {number}")
+    return number
+
+# Function to read the Terraform parallelism from the environment, falling back to the default
+def parallelism_from_env():
+    value = os.environ.get('TF_PARALLELISM')
+    if value is None:
+        return TF_PARALLELISM_DEFAULT
+    try:
+        return positive_int(value)
+    except argparse.ArgumentTypeError as e:
+        log.warning("Ignoring TF_PARALLELISM (%s); using %s", e, TF_PARALLELISM_DEFAULT)
+        return TF_PARALLELISM_DEFAULT
+
+# Terraform apply parallelism (override with the TF_PARALLELISM environment variable or --parallelism)
+TF_PARALLELISM = parallelism_from_env()
+
+# Number of parallel Ansible forks
+ANSIBLE_FORKS = '30'
+
+# Environment overrides for ansible-playbook: let independent tasks run without waiting
+# on each other (long-polling tasks in the playbooks should use async/poll: 0 to benefit)
+ANSIBLE_ENV = {
+    'ANSIBLE_STRATEGY': 'free',
+    'ANSIBLE_FORKS': ANSIBLE_FORKS,
+    'ANSIBLE_PIPELINING': 'True',
+}
+
+# Cache of resolved dependency paths, persisted across runs
+DEPS_CACHE_FILE = f'{HOME}/.cache/gke-deploy/deps.json'
+_deps_cache_lock = threading.Lock()
+DEPS_CACHE_TTL = 24 * 60 * 60
+
+# Python packages needed at runtime, keyed by importable module name
+PYTHON_PACKAGES = {'ansible': 'ansible', 'kubernetes': 'kubernetes'}
+
+# Application Default Credentials file written by `gcloud auth application-default login`
+ADC_FILE = os.path.join(os.environ.get('CLOUDSDK_CONFIG', f'{HOME}/.config/gcloud'), 'application_default_credentials.json')
+
+# Terraform provider plugin cache shared between init runs
+TERRAFORM_PLUGIN_CACHE = f'{HOME}/.terraform.d/plugin-cache'
+
+# Pattern for a single variables.tfvars assignment (comment lines never match)
+TFVARS_PATTERN = re.compile(r'^\s*([A-Za-z_][\w-]*)\s*=\s*"?(.*?)"?\s*$')
+
+# Pattern for the current-context entry of a kubeconfig file (YAML or indented JSON)
+KUBE_CONTEXT_PATTERN = re.compile(r'^[ \t]*"?current-context"?:[ \t]*"?([^",\s]+)"?', re.M)
+
+# gcloud describe error output for a resource that does not exist
+GCLOUD_NOT_FOUND_PATTERN = re.compile(r'NOT_FOUND|code=404|was not found', re.I)
+
+# Existence probe commands (zone, project and cluster name are appended per call)
+DISK_DESCRIBE_CMD = ('gcloud', 'compute', 'disks', 'describe', 'jenkins-disk', '--format=value(name)')
+CLUSTER_DESCRIBE_CMD = ('gcloud', 'container', 'clusters', 'describe', '--format=value(name)')
+
+# Terraform resource addresses
+TF_DISK_RESOURCE = 'google_compute_disk.jenkins_disk'
+TF_CLUSTER_RESOURCE = 'google_container_cluster.primary'
+
+# File inside .terraform/ recording the configuration hash of the last init
+TF_INIT_SENTINEL = '.init-hash'
+
+# Terraform directories already initialized during this run
+_tf_initialized = set()
 
 # Function to run shell commands with error handling
-def run_command(command, error_message, env=None):
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True, env=env)
-        logging.debug(f"Command output: {result.stdout}")
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        logging.error(f"{error_message}: {e}")
-        logging.error(f"Error output: {e.stderr}")
+# Output is read line by line and only the last OUTPUT_TAIL_LINES lines are kept, so memory
+# stays bounded; stderr goes to a temporary file so it cannot pollute parsed stdout
+def run_command(command, error_message, env=None, cwd=None):
+    if command[0] == 'terraform':
+        env = terraform_env(env=env)
+    output = deque(maxlen=OUTPUT_TAIL_LINES)
+    debug_enabled = log.isEnabledFor(logging.DEBUG)
+    with tempfile.TemporaryFile(mode='w+') as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, bufsize=1, text=True, env=env, cwd=cwd)
+        for line in process.stdout:
+            if debug_enabled:
+                log.debug("Command output: %s", line.rstrip())
+            output.append(line)
+        process.stdout.close()
+        returncode = process.wait()
+        if returncode != 0:
+            stderr_file.seek(0)
+            log.error("%s: command %s returned non-zero exit status %s", error_message, command, returncode)
+            log.error("Error output: %s", stderr_file.read())
+            return None
+    return ''.join(output)
+
+# Function to run long-running commands, streaming their output instead of buffering it
+# Returns True on success and None on failure, like run_command
+def run_command_streaming(command, error_message, env=None, cwd=None):
+    if command[0] == 'terraform':
+        env = terraform_env(env=env)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, text=True, env=env, cwd=cwd)
+    for line in process.stdout:
+        sys.stdout.write(line)
+    process.stdout.close()
+    returncode = process.wait()
+    if returncode != 0:
+        log.error("%s. Return code: %s", error_message, returncode)
         return None
+    return True
 
 # Function to parse JSON output safely
 def parse_json(json_string, error_message):
+    import json
     try:
         return json.loads(json_string)
     except json.JSONDecodeError:
-        logging.error(f"{error_message}. This might indicate no resources exist.")
+        log.error("%s. This might indicate no resources exist.", error_message)
         return None
 
 # Function to read Terraform variables
 def read_tfvars(filepath):
-    vars = {}
     try:
         with open(filepath, 'r') as f:
-            for line in f:
-                if '=' in line:
-                    name, value = line.split('=', 1)
-                    vars[name.strip()] = value.strip().strip('"')
+            data = f.read()
     except IOError as e:
-        logging.error(f"Error reading tfvars file: {e}")
+        log.error("Error reading tfvars file: %s", e)
         sys.exit(1)
-    return vars
+    return {m.group(1): m.group(2) for line in data.splitlines() if (m := TFVARS_PATTERN.match(line))}
+
+# Function to hardlink a file, falling back to a copy (e.g. across filesystems)
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
 
 # Function to create repo into working directory
 def prepare_running_directory():
+    from datetime import datetime
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     run_dir = f"/tmp/deployment_{timestamp}"
     
     # Create the main running directory
     os.makedirs(run_dir, exist_ok=True)
 
-    # Clear Terraform cache
-    terraform_cache = os.path.expanduser('~/.terraform.d/plugin-cache')
-    if os.path.exists(terraform_cache):
-        shutil.rmtree(terraform_cache)
+    # Keep the Terraform plugin cache so providers are not downloaded again
+    os.makedirs(TERRAFORM_PLUGIN_CACHE, exist_ok=True)
     
-    # Create subdirectories and copy files
+    # Create subdirectories and link (or copy) files
     for subdir in ['terraform', 'ansible']:
-        os.makedirs(f"{run_dir}/{subdir}", exist_ok=True)
-        for item in os.listdir(subdir):
-            s = os.path.join(subdir, item)
-            d = os.path.join(run_dir, subdir, item)
-            if os.path.isdir(s):
-                shutil.copytree(s, d, symlinks=False, ignore=shutil.ignore_patterns('.terraform', '*.tfstate*'))
-            else:
-                shutil.copy2(s, d)
+        shutil.copytree(subdir, f"{run_dir}/{subdir}", symlinks=False, copy_function=link_or_copy,
+                        ignore=shutil.ignore_patterns('.terraform', '*.tfstate*'), dirs_exist_ok=True)
     
     return run_dir
 
@@ -90,24 +192,31 @@ def set_gcp_project(project_id):
     run_command(['gcloud', 'config', 'set', 'project', project_id], "Error setting GCP project")
 
 # Function to check if a resource exists
+# Returns True/False, or None when the describe failed for any reason other than NOT_FOUND
+# Results are memoized per argv tuple for the lifetime of the run
+@functools.lru_cache(maxsize=8)
 def check_resource_exists(command, resource_name):
-    output = run_command(command, f"Error checking {resource_name} existence")
-    if output is None:
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode == 0:
+        return bool(result.stdout.strip())
+    if GCLOUD_NOT_FOUND_PATTERN.search(result.stderr):
+        log.debug("%s not found: %s", resource_name.capitalize(), result.stderr.strip())
         return False
-    parsed = parse_json(output, f"No valid JSON returned when checking {resource_name} existence")
-    return bool(parsed)
+    log.error("Error checking %s existence: %s returned %s", resource_name, ' '.join(command), result.returncode)
+    log.error("Error output: %s", result.stderr)
+    return None
 
 # Function to check if disk exists
-def check_disk_exists():
+def check_disk_exists(project, zone):
     return check_resource_exists(
-        ['gcloud', 'compute', 'disks', 'list', '--filter=name=jenkins-disk', '--format=json'],
+        DISK_DESCRIBE_CMD + (f'--zone={zone}', f'--project={project}'),
         'disk'
     )
 
 # Function to check if cluster exists
-def check_cluster_exists(cluster_name):
+def check_cluster_exists(project, zone, cluster_name):
     return check_resource_exists(
-        ['gcloud', 'container', 'clusters', 'list', f'--filter=name={cluster_name}', '--format=json'],
+        CLUSTER_DESCRIBE_CMD + (cluster_name, f'--zone={zone}', f'--project={project}'),
         'cluster'
     )
 
@@ -127,89 +236,261 @@ def run_kubectl_command(command, error_message):
     ] + command
     return run_command(full_command, error_message)
 
+# Function to read the current context from the Kubernetes config file
+def get_current_context():
+    global kube_config
+    path = kube_config or os.environ.get('KUBECONFIG') or KUBE_CONFIG_DEFAULT
+    try:
+        with open(path, 'r') as f:
+            match = KUBE_CONTEXT_PATTERN.search(f.read())
+    except IOError:
+        return None
+    return match.group(1) if match else None
+
 # Function to check if PVC exists
 def check_pvc_exists(project, zone, cluster_name, namespace, pvc_name):
     global kube_config
-    # Get cluster credentials
-    run_command(['gcloud', 'container', 'clusters', 'get-credentials', cluster_name, '--zone', zone, '--project', project, f'--kubeconfig={kube_config}'], "Error getting cluster credentials")
+    # Get cluster credentials unless the kubeconfig already points at the cluster
+    if get_current_context() != f"gke_{project}_{zone}_{cluster_name}":
+        run_command(['gcloud', 'container', 'clusters', 'get-credentials', cluster_name, '--zone', zone, '--project', project, f'--kubeconfig={kube_config}'], "Error getting cluster credentials")
     
-    output = run_kubectl_command(['get', 'pvc', pvc_name, '-n', namespace, '-o', 'json'], "Error checking PVC existence")
-    return output is not None
+    output = run_kubectl_command(['get', 'pvc', pvc_name, '-n', namespace, '-o', 'name'], "Error checking PVC existence")
+    return bool(output and output.strip())
+
+# Function to run the disk and cluster existence checks concurrently
+def run_prechecks(vars):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        cluster_future = executor.submit(check_cluster_exists, vars['project'], vars['zone'], vars['cluster_name'])
+        disk_future = executor.submit(check_disk_exists, vars['project'], vars['zone'])
+        return cluster_future.result(), disk_future.result()
+
+# Function to load the persisted dependency cache
+@functools.lru_cache(maxsize=None)
+def load_deps_cache():
+    import json
+    try:
+        with open(DEPS_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+# Function to persist the dependency cache
+def save_deps_cache(cache):
+    import json
+    try:
+        os.makedirs(os.path.dirname(DEPS_CACHE_FILE), exist_ok=True)
+        with open(DEPS_CACHE_FILE, 'w') as f:
+            json.dump(cache, f)
+    except IOError as e:
+        log.warning("Error writing dependency cache: %s", e)
+
+# Function to locate a dependency, reusing the cached path while the binary is unchanged
+# and the entry is less than DEPS_CACHE_TTL old
+@functools.lru_cache(maxsize=None)
+def find_dependency(dependency):
+    with _deps_cache_lock:
+        entry = load_deps_cache().get(dependency)
+    if entry:
+        try:
+            if (os.path.getmtime(entry['path']) == entry['mtime']
+                    and time.time() - entry['checked'] < DEPS_CACHE_TTL):
+                return entry['path']
+        except (OSError, KeyError, TypeError):
+            pass
+
+    path = shutil.which(dependency)
+    # Probes may run concurrently, so serialize updates to the shared cache file
+    with _deps_cache_lock:
+        cache = load_deps_cache()
+        if path is not None:
+            cache[dependency] = {'path': path, 'mtime': os.path.getmtime(path), 'checked': time.time()}
+        else:
+            cache.pop(dependency, None)
+        save_deps_cache(cache)
+    return path
+
+# Function to add ~/.local/bin (where pip installs ansible) to PATH once
+def add_local_bin_to_path():
+    if LOCAL_BIN not in os.environ["PATH"].split(os.pathsep):
+        os.environ["PATH"] += os.pathsep + LOCAL_BIN
 
 # Function to install dependencies
 def install_dependency(dependency, install_command):
-    logging.info(f"Checking for {dependency}...")
-    which_result = run_command(['which', dependency], f"Checking {dependency} installation")
+    log.info("Checking for %s...", dependency)
+    which_result = find_dependency(dependency)
     
     if which_result is None:
-        logging.info(f"{dependency} is not found. Installing {dependency}...")
+        log.info("%s is not found. Installing %s...", dependency, dependency)
         if dependency == 'ansible-playbook':
-            run_command(['pip3', 'install', 'ansible'], f"Error during {dependency} installation")
-            run_command(['pip3', 'install', 'PyYAML'], "Error installing PyYAML library")
-            
+            # The batched pip3 call in install_dependencies() usually installs ansible already;
+            # its module may be importable without the CLI on PATH, so fall back to install_command
             # Update PATH
-            os.environ["PATH"] += os.pathsep + os.path.expanduser("~/.local/bin")
-            logging.info(f"Updated PATH: {os.environ['PATH']}")
+            add_local_bin_to_path()
+            log.info("Updated PATH: %s", os.environ['PATH'])
+            if shutil.which(dependency) is None:
+                if run_command(install_command, f"Error during {dependency} installation") is None:
+                    sys.exit(1)
             
             # Check if ansible-galaxy is now in PATH
-            ansible_galaxy_path = run_command(['which', 'ansible-galaxy'], "Checking ansible-galaxy installation")
+            ansible_galaxy_path = shutil.which('ansible-galaxy')
             if ansible_galaxy_path:
-                logging.info(f"ansible-galaxy found at: {ansible_galaxy_path}")
+                log.info("ansible-galaxy found at: %s", ansible_galaxy_path)
             else:
-                logging.error("ansible-galaxy not found in PATH after installation")
+                log.error("ansible-galaxy not found in PATH after installation")
             
             run_command(['ansible-galaxy', 'collection', 'install', 'kubernetes.core'], "Error installing Kubernetes collection for Ansible")
         else:
             if run_command(install_command, f"Error during {dependency} installation") is None:
                 sys.exit(1)
+        find_dependency.cache_clear()
     else:
-        logging.info(f"{dependency} is already installed at: {which_result}")
+        log.info("%s is already installed at: %s", dependency, which_result)
+
+# Function to install any missing Python packages in a single pip invocation
+def install_python_packages():
+    import importlib.util
+    missing_packages = [package for module, package in PYTHON_PACKAGES.items() if importlib.util.find_spec(module) is None]
+    if not missing_packages:
+        log.info("Python packages are already installed.")
+        return ''
+    log.info("Installing Python packages: %s", ' '.join(missing_packages))
+    return run_command(['pip3', 'install', '--quiet', '--disable-pip-version-check', '--no-input'] + missing_packages, "Error installing Python packages")
+
+# Function to install Python packages and check/install dependencies
+# The probes and the pip install are independent, so they run concurrently;
+# the installs themselves stay sequential since snap does not allow parallel changes
+def install_dependencies(dependencies):
+    with ThreadPoolExecutor(max_workers=len(dependencies) + 1) as executor:
+        pip_future = executor.submit(install_python_packages)
+        list(executor.map(find_dependency, dependencies))
+        pip_future.result()
+    for dependency, install_command in dependencies.items():
+        install_dependency(dependency, install_command)
 
 # Function to create or configure a resource
 def create_or_configure_resource(exists, create_func, resource_name):
     if not exists:
-        logging.info(f"Creating {resource_name}...")
+        log.info("Creating %s...", resource_name)
         create_func()
     else:
-        logging.info(f"{resource_name} already exists. Skipping creation.")
+        log.info("%s already exists. Skipping creation.", resource_name)
+
+# Function to build the environment for Terraform commands
+# run_command/run_command_streaming apply this to every terraform command
+def terraform_env(parallelism=None, env=None):
+    os.makedirs(TERRAFORM_PLUGIN_CACHE, exist_ok=True)
+    env = dict(os.environ if env is None else env)
+    env['TF_PLUGIN_CACHE_DIR'] = TERRAFORM_PLUGIN_CACHE
+    if parallelism is not None:
+        # Nested terraform apply calls inherit the parallelism through TF_CLI_ARGS_apply
+        env['TF_CLI_ARGS_apply'] = f"{env.get('TF_CLI_ARGS_apply', '')} -parallelism={parallelism}".strip()
+    return env
+
+# Function to hash the Terraform configuration and dependency lock file
+def terraform_config_hash(tf_dir):
+    import hashlib
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(tf_dir)):
+        if name.endswith('.tf') or name == '.terraform.lock.hcl':
+            digest.update(name.encode())
+            with open(os.path.join(tf_dir, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+# Function to run terraform init once per directory, skipping it when .terraform/
+# was initialized for the same configuration and lock file
+def ensure_tf_init(tf_dir):
+    tf_dir = os.path.abspath(tf_dir)
+    if tf_dir in _tf_initialized:
+        return True
+    sentinel = os.path.join(tf_dir, '.terraform', TF_INIT_SENTINEL)
+    try:
+        with open(sentinel, 'r') as f:
+            if f.read() == terraform_config_hash(tf_dir):
+                log.debug("Terraform already initialized in %s", tf_dir)
+                _tf_initialized.add(tf_dir)
+                return True
+    except IOError:
+        pass
+    init_result = run_command(['terraform', 'init', '-input=false'], "Error initializing Terraform", cwd=tf_dir)
+    log.debug("Terraform init result: %s", init_result)
+    if init_result is None:
+        return False
+    os.makedirs(os.path.dirname(sentinel), exist_ok=True)
+    with open(sentinel, 'w') as f:
+        f.write(terraform_config_hash(tf_dir))
+    _tf_initialized.add(tf_dir)
+    return True
+
+# Function to list the resource addresses recorded in the Terraform state
+def terraform_state_addresses(tf_dir):
+    if not os.path.exists(os.path.join(tf_dir, 'terraform.tfstate')):
+        return set()
+    output = run_command(['terraform', 'show', '-json', 'terraform.tfstate'], "Error showing Terraform state", cwd=tf_dir)
+    state = parse_json(output or '{}', "No valid JSON returned when showing Terraform state") or {}
+    resources = ((state.get('values') or {}).get('root_module') or {}).get('resources') or []
+    return {resource.get('address') for resource in resources}
+
+# Function to apply the given Terraform resources in a single run
+# The targets are expected to be missing, so the state refresh is skipped unless refresh=True
+def apply_terraform_targets(run_dir, resources, error_message, refresh=False, parallelism=TF_PARALLELISM):
+    # Without any -target the apply would cover the whole configuration
+    if not resources:
+        log.info("No Terraform resources to create.")
+        return True
+    tf_dir = f"{run_dir}/terraform"
+    log.debug("Terraform directory: %s", tf_dir)
+    # Only list the directory and read the file when they will actually be logged
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Contents of Terraform directory: %s", os.listdir(tf_dir))
+        with open(f"{tf_dir}/variables.tfvars", 'r') as f:
+            log.debug("Contents of variables.tfvars:\n%s", f.read())
+
+    # Initialize Terraform
+    if not ensure_tf_init(tf_dir):
+        return None
+    
+    # Drop stale state entries for targets that no longer exist (e.g. in a resumed run),
+    # otherwise the apply without refresh would report no changes
+    state_addresses = terraform_state_addresses(tf_dir)
+    stale = [resource for resource in resources if resource in state_addresses]
+    if stale:
+        log.info("Removing stale resources from Terraform state: %s", ' '.join(stale))
+        if run_command(['terraform', 'state', 'rm'] + stale, "Error removing stale resources from Terraform state", cwd=tf_dir) is None:
+            return None
+    
+    # Apply Terraform changes
+    apply_command = [
+        'terraform', 'apply',
+        '-auto-approve',
+        f'-parallelism={parallelism}',
+        '-var-file=variables.tfvars',
+        '-state=terraform.tfstate',
+    ] + [f'-target={resource}' for resource in resources]
+    if not refresh:
+        apply_command.append('-refresh=false')
+    log.debug("Running Terraform apply command: %s", ' '.join(apply_command))
+    result = run_command_streaming(apply_command, error_message, env=terraform_env(parallelism), cwd=tf_dir)
+    # Resources may now exist, so drop any memoized existence checks
+    check_resource_exists.cache_clear()
+    return result
 
 # Function to create disk
-def create_disk():
-    with change_directory('terraform'):
-        run_command(['terraform', 'init'], "Error initializing Terraform")
-        run_command(['terraform', 'apply', '-auto-approve', '-var-file=variables.tfvars', '-target=google_compute_disk.jenkins_disk'], "Error creating disk")
+def create_disk(run_dir, refresh=False, parallelism=TF_PARALLELISM):
+    return apply_terraform_targets(run_dir, [TF_DISK_RESOURCE], "Error creating disk", refresh, parallelism)
 
 # Function to create cluster
-def create_cluster(run_dir, vars):
-    with change_directory(f"{run_dir}/terraform"):
-        logging.debug(f"Current working directory: {os.getcwd()}")
-        logging.debug(f"Contents of current directory: {os.listdir()}")
-        
-        with open('variables.tfvars', 'r') as f:
-            logging.debug(f"Contents of variables.tfvars:\n{f.read()}")
-
-        # Initialize Terraform
-        init_result = run_command(['terraform', 'init'], "Error initializing Terraform")
-        logging.debug(f"Terraform init result: {init_result}")
-        
-        # Check Terraform state
-        show_result = run_command(['terraform', 'show'], "Error showing Terraform state")
-        if show_result and 'google_container_cluster' in show_result:
-            logging.info("Existing cluster found in Terraform state. Removing it.")
-            run_command(['terraform', 'state', 'rm', 'google_container_cluster.primary'], "Error removing cluster from Terraform state")
-        
-        # Apply Terraform changes
-        apply_command = [
-            'terraform', 'apply',
-            '-auto-approve',
-            '-var-file=variables.tfvars',
-            '-state=terraform.tfstate',
-            '-target=google_container_cluster.primary'
-        ]
-        logging.debug(f"Running Terraform apply command: {' '.join(apply_command)}")
-        result = run_command(apply_command, "Error creating/updating cluster")
-        logging.debug(f"Terraform apply result: {result}")
-    return result
+def create_cluster(run_dir, vars, refresh=False, parallelism=TF_PARALLELISM):
+    return apply_terraform_targets(run_dir, [TF_CLUSTER_RESOURCE], "Error creating/updating cluster", refresh, parallelism)
+
+# Function to create whichever of the disk and cluster are missing in one apply
+def create_disk_and_cluster(run_dir, disk_exists, cluster_exists, refresh=False, parallelism=TF_PARALLELISM):
+    resources = []
+    if not disk_exists:
+        resources.append(TF_DISK_RESOURCE)
+    if not cluster_exists:
+        resources.append(TF_CLUSTER_RESOURCE)
+    return apply_terraform_targets(run_dir, resources, "Error creating disk/cluster", refresh, parallelism)
 
 # Function to create PVC
 def create_pvc(run_dir):
@@ -220,6 +501,7 @@ def create_role_binding(run_dir):
     run_kubectl_command(['apply', '-f', f'{run_dir}/ansible/jenkins-role-binding.yaml'], "Error creating role binding")
 
 def create_temp_ansible_inventory(project, zone):
+    import json
     inventory = {
         'all': {
             'hosts': {
@@ -232,22 +514,21 @@ def create_temp_ansible_inventory(project, zone):
         }
     }
     
-    fd, path = tempfile.mkstemp(prefix='ansible_inventory_', suffix='.yml')
+    fd, path = tempfile.mkstemp(prefix='ansible_inventory_', suffix='.json')
     with os.fdopen(fd, 'w') as f:
-        yaml.dump(inventory, f, default_flow_style=False)
+        json.dump(inventory, f)
     
     return path
 
 # Function to run Ansible playbook
 def run_ansible(vars, run_dir, method='kubectl'):
-    env_vars = os.environ.copy()
-    
     # Create temporary Ansible inventory
     inventory_path = create_temp_ansible_inventory(vars['project'], vars['zone'])
     
     # Debug: Print inventory file contents
-    with open(inventory_path, 'r') as f:
-        logging.debug(f"Ansible inventory file contents:\n{f.read()}")
+    if log.isEnabledFor(logging.DEBUG):
+        with open(inventory_path, 'r') as f:
+            log.debug("Ansible inventory file contents:\n%s", f.read())
     
     try:
         playbook = 'deploy_jenkins.yml' if method == 'kubectl' else 'deploy_jenkins_helm.yml'
@@ -256,22 +537,78 @@ def run_ansible(vars, run_dir, method='kubectl'):
             '-i', inventory_path,
             f'{run_dir}/ansible/{playbook}',
             '--extra-vars', f"project={vars['project']} zone={vars['zone']} cluster_name={vars['cluster_name']}",
+            '-f', ANSIBLE_FORKS,
             '-vvv'
         ]
-        result = subprocess.run(command, capture_output=True, text=True)
-        if result.returncode != 0:
-            logging.error(f"Ansible playbook failed. Return code: {result.returncode}")
-            logging.error(f"Stdout: {result.stdout}")
-            logging.error(f"Stderr: {result.stderr}")
-            return None
-        return result.stdout
+        return run_command_streaming(command, "Ansible playbook failed", env={**os.environ, **ANSIBLE_ENV})
     finally:
         # Clean up the temporary inventory file
         os.remove(inventory_path)
 
+# Function to write a kubeconfig for the cluster straight from the GKE API
+# Only used when google-cloud-container is installed and Application Default Credentials
+# are configured explicitly, so the lookup never falls through to the metadata server
+def write_kube_config_from_api(project, zone, cluster_name):
+    global kube_config
+    import json
+    if not (os.environ.get('GOOGLE_APPLICATION_CREDENTIALS') or os.path.exists(ADC_FILE)):
+        log.debug("No Application Default Credentials configured; using gcloud for cluster credentials")
+        return False
+    try:
+        import google.auth
+        from google.api_core.exceptions import GoogleAPIError
+        from google.auth.exceptions import DefaultCredentialsError
+        from google.cloud import container_v1
+    except ImportError:
+        log.debug("google-cloud-container is not installed; using gcloud for cluster credentials")
+        return False
+    try:
+        credentials, _ = google.auth.default()
+        cluster = container_v1.ClusterManagerClient(credentials=credentials).get_cluster(
+            name=f"projects/{project}/locations/{zone}/clusters/{cluster_name}")
+    except (DefaultCredentialsError, GoogleAPIError) as e:
+        log.warning("Could not fetch cluster details from the GKE API: %s", e)
+        return False
+
+    context_name = f"gke_{project}_{zone}_{cluster_name}"
+    config = {
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'clusters': [{
+            'name': context_name,
+            'cluster': {
+                'server': f"https://{cluster.endpoint}",
+                'certificate-authority-data': cluster.master_auth.cluster_ca_certificate,
+            },
+        }],
+        'users': [{
+            'name': context_name,
+            'user': {
+                'exec': {
+                    'apiVersion': 'client.authentication.k8s.io/v1beta1',
+                    'command': 'gke-gcloud-auth-plugin',
+                    'provideClusterInfo': True,
+                },
+            },
+        }],
+        'contexts': [{
+            'name': context_name,
+            'context': {'cluster': context_name, 'user': context_name},
+        }],
+        'current-context': context_name,
+    }
+    # JSON is valid YAML, so kubectl and gcloud read this file as a regular kubeconfig
+    with open(kube_config, 'w') as f:
+        json.dump(config, f, indent=2)
+    return True
+
 # Function to set Kubernetes context
 def set_kubernetes_context(project, zone, cluster_name):
     global kube_config
+    # Build the kubeconfig in-process; fall back to gcloud/kubectl if the API is unavailable
+    if write_kube_config_from_api(project, zone, cluster_name):
+        return True
+
     # First, get the credentials without specifying the kubeconfig
     command = [
         'gcloud', 'container', 'clusters', 'get-credentials',
@@ -294,7 +631,7 @@ def set_kubernetes_context(project, zone, cluster_name):
             context_name = f"gke_{project}_{zone}_{cluster_name}"
             set_context_command = ['kubectl', 'config', 'use-context', context_name, f'--kubeconfig={kube_config}']
             set_context_result = run_command(set_context_command, "Error setting current context")
-            logging.debug(f"Set current context result: {set_context_result}")
+            log.debug("Set current context result: %s", set_context_result)
             
             return True
     
@@ -306,9 +643,9 @@ def verify_kubectl_connectivity():
     command = ['kubectl', f'--kubeconfig={kube_config}', 'cluster-info']
     result = run_command(command, "Error checking cluster info")
     if result is None:
-        logging.error("Failed to connect to the Kubernetes cluster.")
+        log.error("Failed to connect to the Kubernetes cluster.")
         return False
-    logging.info("Successfully connected to the Kubernetes cluster.")
+    log.info("Successfully connected to the Kubernetes cluster.")
     return True
 
 # set current context for kubernetes
@@ -320,19 +657,18 @@ def set_current_context(project, zone, cluster_name):
         f'--kubeconfig={kube_config}'
     ]
     result = run_command(command, "Error setting current context")
-    logging.debug(f"Set current context result: {result}")
+    log.debug("Set current context result: %s", result)
     return result
 
 # Function to verify Kubernetes context
 def verify_kubernetes_context(expected_project, expected_zone, expected_cluster):
-    result = run_kubectl_command(['config', 'current-context'], "Error getting current context")
-    logging.debug(f"Current Kubernetes context: {result}")
-    if result:
-        current_context = result.strip()
+    current_context = get_current_context()
+    log.debug("Current Kubernetes context: %s", current_context)
+    if current_context:
         expected_context = f"gke_{expected_project}_{expected_zone}_{expected_cluster}"
-        logging.debug(f"Expected context: {expected_context}")
+        log.debug("Expected context: %s", expected_context)
         if current_context != expected_context:
-            logging.warning(f"Current Kubernetes context '{current_context}' does not match expected context '{expected_context}'")
+            log.warning("Current Kubernetes context '%s' does not match expected context '%s'", current_context, expected_context)
             return False
     return True
 
@@ -341,6 +677,13 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description="Deploy Jenkins to GKE")
     parser.add_argument('--method', choices=['kubectl', 'helm'], default='kubectl',
                         help='Deployment method: kubectl (default) or helm')
+    parser.add_argument('--parallelism', type=positive_int, default=TF_PARALLELISM,
+                        help=f'Terraform apply parallelism (default: {TF_PARALLELISM})')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Refresh Terraform state during apply to reconcile drift (skipped by default)')
+    parser.add_argument('--resume', metavar='RUN_DIR',
+                        help='Reuse an existing /tmp/deployment_<timestamp> directory, including its '
+                             'Terraform state and .terraform/ providers, instead of preparing a new one')
     return parser.parse_args()
 
 
@@ -349,20 +692,30 @@ def main():
     args = parse_arguments()
 
     global kube_config
-    # Prepare running directory
-    run_dir = prepare_running_directory()
+    # Prepare running directory, or reuse the one given with --resume
+    if args.resume:
+        run_dir = os.path.abspath(args.resume)
+        if not os.path.isfile(f"{run_dir}/terraform/variables.tfvars"):
+            log.error("Cannot resume from %s: terraform/variables.tfvars not found. Exiting.", run_dir)
+            sys.exit(1)
+        log.info("Resuming deployment in %s", run_dir)
+        # The cluster may have been recreated since, so never reuse the old credentials
+        if os.path.exists(f"{run_dir}/kube_config"):
+            os.remove(f"{run_dir}/kube_config")
+    else:
+        run_dir = prepare_running_directory()
     # Set up environment to use temporary Kubernetes config
     kube_config = f"{run_dir}/kube_config"
     os.environ['KUBECONFIG'] = kube_config
 
     # Check and install dependencies
-    install_dependency('ansible-playbook', ['pip3', 'install', 'ansible'])
-    os.environ["PATH"] += os.pathsep + os.path.expanduser("~/.local/bin")
-    install_dependency('kubectl', ['gcloud', 'components', 'install', 'kubectl'])
-    install_dependency('terraform', ['snap', 'install', 'terraform', '--classic'])
-    install_dependency('helm', ['snap', 'install', 'helm', '--classic'])
-    run_command(['pip3', 'install', 'kubernetes'], "Error installing Kubernetes library")
-    run_command(['pip3', 'install', 'PyYAML'], "Error installing PyYAML library")
+    add_local_bin_to_path()
+    install_dependencies({
+        'ansible-playbook': ['pip3', 'install', 'ansible'],
+        'kubectl': ['gcloud', 'components', 'install', 'kubectl'],
+        'terraform': ['snap', 'install', 'terraform', '--classic'],
+        'helm': ['snap', 'install', 'helm', '--classic'],
+    })
 
     # Read variables
     vars = read_tfvars(f"{run_dir}/terraform/variables.tfvars")
@@ -370,39 +723,56 @@ def main():
     # Set GCP project
     set_gcp_project(vars['project'])
 
-    # Create or configure cluster
-    cluster_exists = check_cluster_exists(vars['cluster_name'])
-    if not cluster_exists:
-        logging.info(f"Creating GKE cluster '{vars['cluster_name']}'...")
-        if create_cluster(run_dir, vars) is None:
-            logging.error("Failed to create cluster. Exiting.")
-            sys.exit(1)
+    # Check existing resources
+    cluster_exists, disk_exists = run_prechecks(vars)
+    if cluster_exists is None or disk_exists is None:
+        log.error("Failed to check for existing disk/cluster. Exiting.")
+        sys.exit(1)
+
+    # Create the disk and cluster if missing
+    if disk_exists:
+        log.info("Jenkins disk already exists.")
+    else:
+        log.info("Creating Jenkins disk...")
+    if cluster_exists:
+        log.info("GKE cluster '%s' already exists.", vars['cluster_name'])
     else:
-        logging.info(f"GKE cluster '{vars['cluster_name']}' already exists.")
+        log.info("Creating GKE cluster '%s'...", vars['cluster_name'])
+    if not (disk_exists and cluster_exists):
+        if create_disk_and_cluster(run_dir, disk_exists, cluster_exists, args.refresh, args.parallelism) is None:
+            log.error("Failed to create disk/cluster. Exiting.")
+            sys.exit(1)
 
     # Set Kubernetes context
     if not set_kubernetes_context(vars['project'], vars['zone'], vars['cluster_name']):
-        logging.error("Failed to set Kubernetes context. Exiting.")
+        log.error("Failed to set Kubernetes context. Exiting.")
         sys.exit(1)
 
     # Verify Kubernetes connectivity
     if not verify_kubectl_connectivity():
-        logging.error("Failed to connect to the Kubernetes cluster. Exiting.")
+        log.error("Failed to connect to the Kubernetes cluster. Exiting.")
         sys.exit(1)
 
     # Run Ansible playbook to deploy Jenkins using the chosen method
-    logging.info(f"Deploying Jenkins using Ansible with {args.method}...")
+    log.info("Deploying Jenkins using Ansible with %s...", args.method)
     if run_ansible(vars, run_dir, args.method) is None:
-        logging.error(f"Failed to deploy Jenkins with {args.method}. Exiting.")
+        log.error("Failed to deploy Jenkins with %s. Exiting.", args.method)
         sys.exit(1)
 
-    logging.info("Deployment completed successfully.")
-    cleanup_old_runs()
-
-def cleanup_old_runs(max_runs=5):
-    runs = sorted([d for d in os.listdir('/tmp') if d.startswith('deployment_')], reverse=True)
-    for old_run in runs[max_runs:]:
-        shutil.rmtree(f"/tmp/{old_run}")
+    log.info("Deployment completed successfully.")
+    cleanup_old_runs(current_run_dir=run_dir)
+
+def cleanup_old_runs(max_runs=5, current_run_dir=None):
+    with os.scandir('/tmp') as entries:
+        runs = sorted((e.name for e in entries if e.name.startswith('deployment_') and e.is_dir(follow_symlinks=False)), reverse=True)
+    # Never delete the directory of the current run (e.g. an older one reused with --resume)
+    current_run = os.path.basename(os.path.normpath(current_run_dir)) if current_run_dir else None
+    old_runs = [run for run in runs[max_runs:] if run != current_run]
+    if not old_runs:
+        return
+    # Delete old runs in parallel; ignore_errors keeps one broken directory from blocking the rest
+    with ThreadPoolExecutor(max_workers=min(8, len(old_runs))) as executor:
+        list(executor.map(lambda old_run: shutil.rmtree(f"/tmp/{old_run}", ignore_errors=True), old_runs))
 
 
 